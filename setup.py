@@ -28,5 +28,12 @@ setup(name='sprite_tools',
     keywords = 'sprite frame animator animation extractor graphics transform',
     install_requires = ['opencv-python','numpy','scipy'],
     packages = ['sprite_tools'],
+    entry_points = {
+        'console_scripts': [
+            'sprite-render = sprite_tools.cli:renderMain',
+            'sprite-extract = sprite_tools.cli:extractMain',
+            'sprite-service = sprite_tools.service:main',
+        ],
+    },
     include_package_data = True,
     zip_safe = False)
@@ -1,4 +1,26 @@
 #!/usr/bin/env python
 
-from sprite_tools import animator
-from sprite_tools import extractor
+import sys
+import types
+import importlib
+
+# Submodules are imported on first use so using one submodule does not load
+# the dependencies of the others (i.e. SciPy for the extractor module).
+_submodules = ('animator', 'extractor', 'service', 'encoder', 'cli')
+
+class _LazyModule(types.ModuleType):
+
+    """sprite_tools package that imports its submodules on first use."""
+
+    def __getattr__(self, name):
+        if name in _submodules:
+            return importlib.import_module('sprite_tools.' + name)
+        raise AttributeError("module 'sprite_tools' has no attribute '%s'" % name)
+
+# Module level __getattr__ needs Python 3.7, so the package module is replaced
+# by a module object whose class has one. The original module is kept alive
+# because Python 2 clears the globals of a module once it is collected.
+_lazyModule = _LazyModule(__name__, __doc__)
+_lazyModule.__dict__.update(globals())
+_lazyModule._module = sys.modules[__name__]
+sys.modules[__name__] = _lazyModule
@@ -59,6 +59,14 @@
     editing software. Parametric equations can also be used with these 
     transforms for more complex transformations.    
 
+    Draft Rendering -- Frames can be rendered at a fraction of their size and
+    only every Nth frame can be rendered to quickly check the timing and
+    motion of an animation. Draft frames can also be written to a single 
+    video file instead of a png image sequence.
+
+    Animated Output -- Frames can be written to a single animated png or gif
+    file that only stores the region of each frame that changed.
+
     Required Packages:
     - Python 2.7
     - OpenCV (cv2)
@@ -88,10 +96,15 @@ __version__ = '0.1.01'
 __author__ = 'Kimberly McIntyre'
 
 import os
+import weakref
+from fractions import Fraction
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 import cv2
 
+from sprite_tools.encoder import ApngWriter, GifWriter
+
 class Frame(object):
 
     """Processes sprite images and pastes them into a png image sequence. 
@@ -116,15 +129,21 @@ class Frame(object):
 
        Once all frames of the animation are finished, the render method can 
        be used to export the frames to file as a sequence of png images.      
+
+       Keyword Arguments:
+       spriteCache -- Object with get(key) and put(key, value, nbytes) 
+                      methods that keeps transformed sprites between frames
+                      and renders (i.e. sprite_tools.service.SpriteCache).
     """
     
-    def __init__(self):
+    def __init__(self, spriteCache=None):
         self.alphaChannel = 0
+        self.spriteCache = spriteCache
         self.frameList = []
-        self.instrKeys = ['image', 'position', 'alpha', 'rotation', 'scale', 'flip'] 
+        self.instrKeys = ['image', 'position', 'alpha', 'rotation', 'scale', 'flip', 'trim'] 
         self.instr = {key:[] for key in self.instrKeys}
 
-    def setAlpha(channel):
+    def setAlpha(self, channel):
         """ Converts RGB defined color into an alpha channel for all sprites.
         
         Keyword Arguments:
@@ -166,6 +185,11 @@ class Frame(object):
         self.instr['rotation'].append(rotation)
         self.instr['scale'].append(scale)
         self.instr['flip'].append(flip)
+        # Sprites are trimmed when rendered so the alpha color of setAlpha is used
+        if eventName in frameElem.trimDict:
+            self.instr['trim'].append((frameElem, eventName, imgNum))
+        else:
+            self.instr['trim'].append(None)
 
     def save(self,repeatFrames=1):
         """Appends instructions to Frame for processing of all FrameElements.
@@ -178,34 +202,254 @@ class Frame(object):
             self.frameList.append(self.instr)
         self.instr = {key:[] for key in self.instrKeys}
 
-    def render(self, outDir, outPrefix):
+    def render(self, outDir, outPrefix, previewScale=1, frameStride=1,
+               videoFile=None, fps=60, tileSize=None, threads=1, 
+               animFile=None):
         """ Outputs a seqeuence of png images to the specified directory
             using the instructions stored from the save() method
 
             Keyword Arguments:
-            outDir    -- Directory where the image sequence will be saved to.
-            outPrefix -- Start of name for each image in the image sequence.
-                         This prefix will be followed by the index of the 
-                         image in the image sequence.    
+            outDir       -- Directory where the image sequence will be saved to.
+            outPrefix    -- Start of name for each image in the image sequence.
+                            This prefix will be followed by the index of the 
+                            image in the image sequence.    
+            previewScale -- Float value between 0 and 1 that defines the size
+                            of a draft render relative to the full frame
+                            (i.e. 0.25 renders a frame a quarter of the width
+                            and height). Positions and scales are adjusted to
+                            match.
+            frameStride  -- Positive integer value where only every Nth frame
+                            of the animation is rendered.
+            videoFile    -- Name of a video file in outDir that the frames are
+                            written to instead of the png image sequence.
+            fps          -- Frame rate of the animation. The frame rate of 
+                            videoFile is divided by frameStride so the timing
+                            of the animation is kept.
+            tileSize     -- Length of sides (in pixels) of the square tiles
+                            that each frame is composited in. None composites
+                            each sprite in one piece.
+            threads      -- Number of threads that composite the tiles of a
+                            frame when tileSize is given.
+            animFile     -- Name of an animated png (.png) or gif (.gif) file
+                            in outDir that the frames are written to instead
+                            of the png image sequence.
+
+            Additional Notes:
+            - A draft render (previewScale < 1) uses nearest neighbour 
+              interpolation and uncompressed png images for faster output.
+            - Images of a strided render keep the index of their frame in the
+              full animation.
+            - A tiled render outputs the same images as an untiled render.
+              Tiles of around 128 pixels keep the compositing of each tile
+              within the cpu cache.
+            - Frames of animFile only store the region that changed from the
+              previous frame. Frames repeated with save(repeatFrames) or that
+              do not change are stored once with a longer delay.
         """
-        frameIndex = 0
+        pool = None
+        if tileSize is not None and threads > 1:
+            pool = ThreadPool(threads)
+        imwriteParams = []
+        if previewScale != 1:
+            imwriteParams = [cv2.IMWRITE_PNG_COMPRESSION, 0]
+        video = None
+        animWriter = None
+        (prevFrame, frame, layout) = (None, None, None)
         frameCount = len(self.frameList)
-        for curFrame in self.frameList:
-            objCount = len(curFrame['image'])
-            frameElement = [curFrame['image'][x] for x in range(objCount)]
-            frameElement = [self._flipSprite(frameElement[x], curFrame['flip'][x]) for x in range(objCount)]		
-            frameElement = [self._scaleSprite(frameElement[x], curFrame['scale'][x]) for x in range(objCount)]
-            unPack = [self._rotateSprite(frameElement[x], curFrame['rotation'][x], curFrame['position'][x]) for x in range(objCount)]
-            frameElement = [elem[0] for elem in unPack]
-            curFrame['position'] = [elem[1] for elem in unPack]
-            frameElement = [self._alphaSprite(frameElement[x], curFrame['alpha'][x]) for x in range(objCount)]
-            frame = np.ones((frameElement[0].shape), dtype = np.uint8) * 255
-            for i in range(objCount):				
-                frame = self._layerSprite(frameElement[i], frame, curFrame['position'][i])
-            # save/export frame to file
-            newFileName = outDir + '/' + outPrefix + ('%.*d' % ((len(str(frameCount))), frameIndex)) + '.png'
-            cv2.imwrite(newFileName, frame[:, :, 0:3])
-            frameIndex += 1
+        # The pool threads and output file are closed even if a frame fails
+        try:
+            for frameIndex in xrange(0, frameCount, frameStride):
+                curFrame = self.frameList[frameIndex]
+                # Frames repeated with save(repeatFrames) share instructions
+                repeated = curFrame is prevFrame
+                if not repeated:
+                    (prevImage, prevLayout) = (frame, layout)
+                    (frame, layout) = self._composeFrame(
+                        curFrame, previewScale, tileSize, pool)
+                prevFrame = curFrame
+                if animFile is not None:
+                    delay = Fraction(frameStride) / Fraction(str(fps))
+                    if animWriter is None:
+                        if animFile.lower().endswith('.gif'):
+                            animWriter = GifWriter(outDir + '/' + animFile, 
+                                                   frame.shape[1], 
+                                                   frame.shape[0])
+                        else:
+                            animWriter = ApngWriter(outDir + '/' + animFile, 
+                                                    frame.shape[1], 
+                                                    frame.shape[0])
+                    changedRect = None
+                    if not repeated:
+                        changedRect = self._changedRect(prevImage, frame, 
+                                                        prevLayout, layout)
+                    if changedRect is None:
+                        animWriter.extendFrame(delay)
+                        continue
+                    (x1, y1, x2, y2) = changedRect
+                    animWriter.addFrame(frame[y1:y2, x1:x2, 0:3], x1, y1, 
+                                        delay)
+                    continue
+                if videoFile is not None:
+                    if video is None:
+                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                        video = cv2.VideoWriter(outDir + '/' + videoFile, 
+                                                fourcc, float(fps) / frameStride,
+                                                (frame.shape[1], 
+                                                 frame.shape[0]))
+                    video.write(np.ascontiguousarray(frame[:, :, 0:3]))
+                    continue
+                # save/export frame to file
+                newFileName = outDir + '/' + outPrefix + ('%.*d' % ((len(str(frameCount))), frameIndex)) + '.png'
+                cv2.imwrite(newFileName, frame[:, :, 0:3], imwriteParams)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if video is not None:
+                video.release()
+            if animWriter is not None:
+                animWriter.close()
+
+    def _composeFrame(self, curFrame, previewScale=1, tileSize=None, pool=None):
+        """Transforms and layers all sprites of a saved frame onto a canvas.
+
+           Returns the frame and its layout. The layout holds the 
+           instructions and (x1, y1, x2, y2) bounding box of each sprite.
+        """
+        objCount = len(curFrame['image'])
+        frameElement = []
+        position = []
+        layout = []
+        for x in range(objCount):
+            (image, trim) = (curFrame['image'][x], None)
+            if curFrame['trim'][x] is not None:
+                (frameElem, eventName, imgNum) = curFrame['trim'][x]
+                (image, trim) = frameElem.trimSprite(eventName, imgNum, 
+                                                     self.alphaChannel)
+            (sprite, offset, fullShape) = self._cachedSprite(
+                image, curFrame['flip'][x], curFrame['scale'][x],
+                curFrame['rotation'][x], curFrame['alpha'][x], previewScale,
+                trim)
+            if x == 0:
+                # The untrimmed first sprite defines the size of the frame
+                canvasShape = (fullShape[0], fullShape[1], 4)
+            (posX, posY) = curFrame['position'][x]
+            if previewScale != 1:
+                posX = int(round(posX * previewScale))
+                posY = int(round(posY * previewScale))
+            frameElement.append(sprite)
+            position.append((posX + offset[0], posY + offset[1]))
+            instr = (id(curFrame['image'][x]), tuple(curFrame['position'][x]),
+                     curFrame['alpha'][x], curFrame['rotation'][x],
+                     curFrame['scale'][x], tuple(curFrame['flip'][x]))
+            layout.append((instr, (position[x][0], position[x][1],
+                                   position[x][0] + sprite.shape[1],
+                                   position[x][1] + sprite.shape[0])))
+        frame = np.ones(canvasShape, dtype = np.uint8) * 255
+        if tileSize is not None:
+            frame = self._layerTiles(frameElement, frame, position, tileSize, 
+                                     pool)
+            return (frame, layout)
+        for i in range(objCount):				
+            frame = self._layerSprite(frameElement[i], frame, position[i])
+        return (frame, layout)
+
+    def _changedRect(self, prevImage, image, prevLayout, layout):
+        """Returns the (x1, y1, x2, y2) region of a frame that changed from
+           the previous frame or None if the frame did not change.
+
+           Only the bounding boxes of sprites whose instructions changed are
+           compared with the previous frame.
+        """
+        [rowCount, columnCount, BGRA] = image.shape
+        if prevImage is None or prevImage.shape != image.shape:
+            return (0, 0, columnCount, rowCount)
+        boxes = []
+        for i in range(max(len(prevLayout), len(layout))):
+            layers = [x[i] for x in (prevLayout, layout) if i < len(x)]
+            if len(layers) == 2 and layers[0][0] == layers[1][0]:
+                continue
+            boxes += [x[1] for x in layers]
+        if len(boxes) == 0:
+            return None
+        x1 = max(0, min([x[0] for x in boxes]))
+        y1 = max(0, min([x[1] for x in boxes]))
+        x2 = min(columnCount, max([x[2] for x in boxes]))
+        y2 = min(rowCount, max([x[3] for x in boxes]))
+        if x1 >= x2 or y1 >= y2:
+            return None
+        changed = np.any(prevImage[y1:y2, x1:x2, 0:3] != image[y1:y2, x1:x2, 0:3],
+                         axis=2)
+        changedRows = np.flatnonzero(np.any(changed, axis=1))
+        changedColumns = np.flatnonzero(np.any(changed, axis=0))
+        if len(changedRows) == 0:
+            return None
+        return (x1 + int(changedColumns[0]), y1 + int(changedRows[0]),
+                x1 + int(changedColumns[-1]) + 1, y1 + int(changedRows[-1]) + 1)
+
+    def _cachedSprite(self, sprite, flip, scale, rotation, alpha, 
+                      previewScale=1, trim=None):
+        """Returns the transformed sprite from the sprite cache if present."""
+        if self.spriteCache is None:
+            return self._transformSprite(sprite, flip, scale, rotation, alpha,
+                                         previewScale, trim)
+        key = (id(sprite), tuple(flip), scale, rotation, alpha, previewScale,
+               self.alphaChannel)
+        entry = self.spriteCache.get(key)
+        # A weak reference to the source sprite turns a reused id into a miss
+        # without keeping the source sprite alive in the cache
+        if entry is None or entry[0]() is not sprite:
+            transformed = self._transformSprite(sprite, flip, scale, rotation,
+                                                alpha, previewScale, trim)
+            entry = (weakref.ref(sprite), transformed)
+            self.spriteCache.put(key, entry, transformed[0].nbytes)
+        return entry[1]
+
+    def _transformSprite(self, sprite, flip, scale, rotation, alpha, 
+                         previewScale=1, trim=None):
+        """Flips, scales, rotates and adds an alpha channel to a sprite image.
+
+           Returns the transformed sprite, the offset of its top left corner
+           from the position of the sprite and the rows and columns of the
+           transformed untrimmed sprite image. The offset of a sprite trimmed
+           by FrameElement is moved with each transform so the output matches
+           the untrimmed sprite image (the edges of rotated sprites can differ
+           by single pixels from the fixed point rounding of cv2.warpAffine).
+        """
+        interpolation = cv2.INTER_LINEAR
+        spriteTransformed = self._flipSprite(sprite, flip)
+        trimOffset = None
+        fullShape = None
+        if trim is not None:
+            [rowCount, columnCount, BGR] = sprite.shape
+            (trimX, trimY, fullRows, fullColumns) = trim
+            # Matches _flipSprite where a vertical flip replaces a horizontal flip
+            if flip[1]:
+                trimY = fullRows - trimY - rowCount
+            elif flip[0]:
+                trimX = fullColumns - trimX - columnCount
+        if previewScale == 1:
+            spriteTransformed = self._scaleSprite(spriteTransformed, scale)
+            if trim is not None:
+                trimOffset = (trimX * scale, trimY * scale)
+                fullShape = (fullRows * scale, fullColumns * scale)
+        else:
+            interpolation = cv2.INTER_NEAREST
+            scaleFactor = scale * previewScale
+            if trim is None:
+                spriteTransformed = self._previewSprite(spriteTransformed, 
+                                                        scaleFactor)
+            else:
+                fullShape = (max(1, int(round(fullRows * scaleFactor))),
+                             max(1, int(round(fullColumns * scaleFactor))))
+                (spriteTransformed, trimOffset) = self._previewTrimmedSprite(
+                    spriteTransformed, (trimX, trimY), (fullRows, fullColumns),
+                    fullShape)
+        (spriteTransformed, offset, fullShape) = self._rotateSprite(
+            spriteTransformed, rotation, (0, 0), interpolation, trimOffset, 
+            fullShape)
+        spriteTransformed = self._alphaSprite(spriteTransformed, alpha)
+        return (spriteTransformed, offset, fullShape)
 
     def _flipSprite(self, sprite, flipTuple):
         """Flips the sprite image horizontally and/or vertically."""
@@ -226,13 +470,65 @@ class Frame(object):
         spriteScaled[:, :, 2] = np.kron(sprite[:, :, 2], scaleArray)
         return spriteScaled
 
-    def _rotateSprite(self, sprite, rotation, position):
+    def _previewSprite(self, sprite, scaleFactor):
+        """Scales the sprite image by a float multiplier for draft renders."""
+        [rowCount, columnCount, BGR] = sprite.shape
+        newDims = (max(1, int(round(columnCount * scaleFactor))),
+                   max(1, int(round(rowCount * scaleFactor))))
+        return cv2.resize(sprite, newDims, interpolation = cv2.INTER_NEAREST)
+
+    def _previewTrimmedSprite(self, sprite, trimOffset, fullShape, previewShape):
+        """Scales a trimmed sprite image for draft renders.
+
+           The pixels that _previewSprite samples from the untrimmed sprite
+           image (fullShape) are sampled from the trimmed sprite image so 
+           both draft renders match. Returns the scaled sprite and its offset
+           in the scaled untrimmed sprite image (previewShape).
+        """
+        sourceIndices = []
+        keptIndices = []
+        for axis in (0, 1):
+            # cv2.resize with INTER_NEAREST samples floor(i * old / new)
+            inverseScale = 1.0 / (float(previewShape[axis]) / fullShape[axis])
+            source = np.floor(np.arange(previewShape[axis]) * inverseScale)
+            source = np.minimum(source.astype(int), fullShape[axis] - 1)
+            source -= trimOffset[1 - axis]
+            kept = np.flatnonzero((source >= 0) & (source < sprite.shape[axis]))
+            sourceIndices.append(source[kept])
+            keptIndices.append(kept)
+        if len(keptIndices[0]) == 0 or len(keptIndices[1]) == 0:
+            # None of the visible pixels are sampled at this scale
+            spriteAlpha = np.full((1, 1, 3), self.alphaChannel, dtype = np.uint8)
+            return (spriteAlpha, (0, 0))
+        spritePreview = sprite[sourceIndices[0][:, np.newaxis], sourceIndices[1]]
+        (offsetX, offsetY) = (int(keptIndices[1][0]), int(keptIndices[0][0]))
+        # _rotateSprite rounds half pixel ties of INTER_NEAREST to even pixels,
+        # so an even offset keeps them the same as for the untrimmed sprite
+        (padX, padY) = (offsetX % 2, offsetY % 2)
+        if padX or padY:
+            spritePadded = np.full((spritePreview.shape[0] + padY, 
+                                    spritePreview.shape[1] + padX, 3),
+                                   self.alphaChannel, dtype = np.uint8)
+            spritePadded[padY:, padX:, :] = spritePreview
+            spritePreview = spritePadded
+        return (spritePreview, (offsetX - padX, offsetY - padY))
+
+    def _rotateSprite(self, sprite, rotation, position, 
+                      interpolation=cv2.INTER_LINEAR, trimOffset=None,
+                      fullShape=None):
         """Rotates the sprite image 
 
            Rotation is in degrees where positive values produce a
            counter-clockwise rotation.
+
+           A trimmed sprite image is rotated about the center of the 
+           untrimmed sprite image (fullShape) and only the bounding box of the
+           rotated trimmed sprite is returned. Returns the rotated sprite, its
+           position and the rows and columns of the rotated untrimmed sprite.
         """
         [rowCount, columnCount, BGR] = sprite.shape		
+        if fullShape is not None:
+            (rowCount, columnCount) = fullShape
         (cXR, cYR) = (columnCount // 2, rowCount // 2)
         (cXA, cYA) = (position[0] + cXR, position[1] + cYR)
         rotationMatrix = cv2.getRotationMatrix2D((cXR, cYR), rotation, 1)
@@ -243,8 +539,35 @@ class Frame(object):
         newPos = (cXA - (newWidth // 2) , cYA - (newHeight // 2))
         rotationMatrix[0, 2] += (newWidth / 2) - cXR
         rotationMatrix[1, 2] += (newHeight / 2) - cYR
-        spriteRotated = cv2.warpAffine(sprite, rotationMatrix, (newWidth, newHeight))
-        return (spriteRotated, newPos)
+        # The corners outside of the sprite (and any trimmed margin) are the 
+        # alpha color
+        borderColor = (self.alphaChannel, self.alphaChannel, self.alphaChannel)
+        if trimOffset is None:
+            spriteRotated = cv2.warpAffine(sprite, rotationMatrix, (newWidth, newHeight),
+                                           flags = interpolation,
+                                           borderValue = borderColor)
+            return (spriteRotated, newPos, (newHeight, newWidth))
+
+        # Move the trimmed sprite to its place in the untrimmed sprite and
+        # crop the output to the bounding box of its rotated corners
+        [trimRows, trimColumns, BGR] = sprite.shape
+        rotationMatrix[:, 2] += rotationMatrix[:, 0:2].dot(trimOffset)
+        corners = np.array([[-1, trimColumns, -1, trimColumns],
+                            [-1, -1, trimRows, trimRows],
+                            [1, 1, 1, 1]], dtype = float)
+        rotatedCorners = rotationMatrix.dot(corners)
+        boxX1 = max(0, int(np.floor(rotatedCorners[0].min())) - 1)
+        boxY1 = max(0, int(np.floor(rotatedCorners[1].min())) - 1)
+        boxX2 = max(boxX1 + 1, min(newWidth, int(np.ceil(rotatedCorners[0].max())) + 2))
+        boxY2 = max(boxY1 + 1, min(newHeight, int(np.ceil(rotatedCorners[1].max())) + 2))
+        rotationMatrix[0, 2] -= boxX1
+        rotationMatrix[1, 2] -= boxY1
+        spriteRotated = cv2.warpAffine(sprite, rotationMatrix, 
+                                       (boxX2 - boxX1, boxY2 - boxY1),
+                                       flags = interpolation,
+                                       borderValue = borderColor)
+        newPos = (newPos[0] + boxX1, newPos[1] + boxY1)
+        return (spriteRotated, newPos, (newHeight, newWidth))
 
     def _alphaSprite(self, sprite, alpha):
         """Adds an alpha channel to a sprite image with specified transparency."""
@@ -261,6 +584,37 @@ class Frame(object):
         spriteAlpha[:, :, 3] = blackPixels[:, :]
         return spriteAlpha
 
+    def _layerTiles(self, sprites, frame, positions, tileSize, pool=None):
+        """Pastes the sprite images onto the frame one tile at a time.
+
+           Each tile is layered with every sprite that overlaps it in the
+           order the sprites were added. Tiles do not share pixels so they 
+           are split across the threads of the pool when one is given.
+        """
+        [frameHeight, frameWidth, BGRA] = frame.shape
+        tiles = [(tileX, tileY) for tileY in xrange(0, frameHeight, tileSize)
+                                for tileX in xrange(0, frameWidth, tileSize)]
+
+        def layerTile(tile):
+            (tileX, tileY) = tile
+            frameTile = frame[tileY:(tileY + tileSize), tileX:(tileX + tileSize), :]
+            [tileHeight, tileWidth, BGRA] = frameTile.shape
+            for i in range(len(sprites)):
+                [rowCount, columnCount, BGRA] = sprites[i].shape
+                (posX, posY) = (positions[i][0] - tileX, positions[i][1] - tileY)
+                if (posX >= tileWidth or posY >= tileHeight or 
+                    posX + columnCount <= 0 or posY + rowCount <= 0):
+                    continue
+                # The tile is a view of the frame so it is layered in place
+                self._layerSprite(sprites[i], frameTile, (posX, posY))
+
+        if pool is None:
+            for tile in tiles:
+                layerTile(tile)
+        else:
+            pool.map(layerTile, tiles)
+        return frame
+
     def _layerSprite(self, sprite, frame, position):
         """Pastes the sprite image onto the frame at position (x,y)."""		
         # Crop the background and frame element to obtain the intersection				
@@ -285,6 +639,9 @@ class Frame(object):
         if cropX2 > frame.shape[1]:
             cropSpriteX2 = columnCount - (cropX2 - frame.shape[1])				
             cropX2 = frame.shape[1]				
+        if cropY2 <= cropY1 or cropX2 <= cropX1:
+            # A trimmed sprite can lie outside of the frame
+            return frame
         frameCropped = frame[cropY1:cropY2, cropX1:cropX2, :]
         spriteCropped = sprite[cropSpriteY1:cropSpriteY2, cropSpriteX1:cropSpriteX2, :]
 
@@ -352,6 +709,7 @@ class FrameElement(object):
     
        Summary of Class Methods:
        addNewEvent  -- Stores and Catagorizes image sequences of sprites.
+       trimSprite   -- Returns a sprite image cropped to its visible pixels.
        setCurSprite -- Returns index of image that loops image sequence. 
 
        A FrameElement is technically a collection of related sprites. These
@@ -375,9 +733,10 @@ class FrameElement(object):
     
     def __init__(self): 
         self.eventDict = {}
+        self.trimDict = {}
         self.curSpriteIndex = -1
 
-    def addNewEvent(self, eventName, imageFolderDir):
+    def addNewEvent(self, eventName, imageFolderDir, trim=True):
         """Stores related sprite images into dictionary
 
         Keyword Arguments:
@@ -386,12 +745,61 @@ class FrameElement(object):
                           are located. The folder must only contain related
                           sprite images. The sprite images must be sequenced
                           in alphanumerical order.   
+        trim           -- Boolean that crops each sprite image to the pixels
+                          that are not the alpha color of the Frame it is
+                          rendered by. The crop is undone when the Frame is 
+                          rendered so the frames do not change, but 
+                          transparent margins are not processed.
         """		
         inputFileList = os.listdir(imageFolderDir)
         inputFileList.sort()
         inputFileList = [imageFolderDir + '/' + x for x in inputFileList] 
         imgList = [cv2.imread(x) for x in inputFileList]
         self.eventDict[eventName] = imgList
+        if trim:
+            self.trimDict[eventName] = {}
+        else:
+            self.trimDict.pop(eventName, None)
+
+    def trimSprite(self, eventName, imgNum, alphaChannel):
+        """Returns a sprite image cropped to the pixels that are not the alpha
+           color and the crop of the sprite image (see _trimSprite).
+
+           Keyword Arguments:
+           eventName    -- String name for collection of related sprite images.
+           imgNum       -- Index of an image in the image sequence.
+           alphaChannel -- Integer value of the alpha color set with the 
+                           Frame's setAlpha method.
+
+           The cropped sprite image is kept so each Frame that renders the
+           sprite with the same alpha color gets the same image.
+        """
+        trims = self.trimDict[eventName]
+        key = (imgNum, alphaChannel)
+        if key not in trims:
+            trims[key] = self._trimSprite(self.eventDict[eventName][imgNum],
+                                          alphaChannel)
+        return trims[key]
+
+    def _trimSprite(self, sprite, alphaChannel):
+        """Crops the sprite image to the bounding box of its visible pixels.
+
+           Returns a view of the cropped sprite and a tuple of the x and y 
+           offset of the crop and the rows and columns of the uncropped sprite
+           image (None if the sprite image is not cropped).
+        """
+        [rowCount, columnCount, BGR] = sprite.shape
+        visiblePixels = np.any(sprite != alphaChannel, axis=2)
+        visibleRows = np.flatnonzero(np.any(visiblePixels, axis=1))
+        visibleColumns = np.flatnonzero(np.any(visiblePixels, axis=0))
+        if len(visibleRows) == 0:
+            return (sprite, None)
+        (cropY1, cropY2) = (int(visibleRows[0]), int(visibleRows[-1]) + 1)
+        (cropX1, cropX2) = (int(visibleColumns[0]), int(visibleColumns[-1]) + 1)
+        if (cropY2 - cropY1, cropX2 - cropX1) == (rowCount, columnCount):
+            return (sprite, None)
+        spriteCropped = sprite[cropY1:cropY2, cropX1:cropX2, :]
+        return (spriteCropped, (cropX1, cropY1, rowCount, columnCount))
 
     def setCurSprite(self,eventName, startIndex=0):
         """Defines the current image that will continue a looping animation
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+""" Command line entry points for batch rendering and sprite extraction.
+
+    Description:
+
+    sprite-render renders JSON animation jobs (see the job format of the
+    service module) and sprite-extract runs the extractor pipeline over
+    folders of captured frames or video files. Both accept --jobs to
+    process several inputs at once in separate processes.
+
+    The animator, extractor and their dependencies (OpenCV, numpy, SciPy)
+    are only imported once an input is processed, so --dry-run and --help
+    return without loading them.
+
+    Example:
+    - sprite-render cat_animation.json --preview 0.25 --stride 4
+    - sprite-render ./Jobs/*.json --jobs 4
+    - sprite-extract ./Captures/Walk ./Captures/run.mp4 --out ./Sprites --jobs 2
+"""
+
+import os
+import json
+import argparse
+from multiprocessing import Pool
+
+def renderMain(argv=None):
+    """Renders JSON animation jobs from the command line."""
+    parser = argparse.ArgumentParser(description='Renders JSON animation '
+                                     'jobs to image sequences, videos or '
+                                     'animated images.')
+    parser.add_argument('jobFiles', nargs='+', metavar='JOB',
+                        help='JSON job file')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of jobs rendered at the same time')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='check the jobs and print their size only')
+    parser.add_argument('--preview', type=float, dest='previewScale',
+                        help='fraction of the frame size to render at')
+    parser.add_argument('--stride', type=int, dest='frameStride',
+                        help='render only every Nth frame')
+    parser.add_argument('--fps', type=float, help='frame rate of the animation')
+    parser.add_argument('--video', dest='videoFile',
+                        help='video file in outDir to write the frames to')
+    parser.add_argument('--anim', dest='animFile',
+                        help='animated .png or .gif file in outDir to write '
+                        'the frames to')
+    parser.add_argument('--tile', type=int, dest='tileSize',
+                        help='composite frames in tiles of this size')
+    parser.add_argument('--threads', type=int,
+                        help='threads that composite the tiles of a frame')
+    args = parser.parse_args(argv)
+    overrides = dict([(key, getattr(args, key)) for key in
+                      ('previewScale', 'frameStride', 'fps', 'videoFile',
+                       'animFile', 'tileSize', 'threads')
+                      if getattr(args, key) is not None])
+    if args.dry_run:
+        errors = [_checkJob(x) for x in args.jobFiles]
+        return 1 if any(errors) else 0
+    results = _runAll(_renderJob, [(x, overrides) for x in args.jobFiles],
+                      args.jobs)
+    return 0 if all(results) else 1
+
+def extractMain(argv=None):
+    """Extracts sprites from folders of frames or video files from the
+       command line.
+    """
+    parser = argparse.ArgumentParser(description='Isolates, cleans and '
+                                     'deduplicates sprites from captured '
+                                     'frames.')
+    parser.add_argument('inputs', nargs='+', metavar='INPUT',
+                        help='folder of captured frames or video file')
+    parser.add_argument('--out', required=True,
+                        help='folder that a sprite folder per input is saved to')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of inputs processed at the same time')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list the inputs and output folders only')
+    parser.add_argument('--input-prefix', default='',
+                        help='start of the names of captured frame files')
+    parser.add_argument('--prefix', default='Sprite_',
+                        help='start of the names of saved sprite files')
+    parser.add_argument('--background',
+                        help='background image (estimated when not given)')
+    parser.add_argument('--limit', type=int, default=10,
+                        help='cleaning multiplier for finding background '
+                        'pixels')
+    # The largest region of an uncropped capture is the background
+    parser.add_argument('--no-area-toggle', action='store_false',
+                        dest='area_toggle',
+                        help='use the largest region as the sprite instead '
+                        'of the second largest')
+    parser.add_argument('--crop', choices=['frame', 'clip'], default='frame',
+                        help='crop sprites to each frame (default) or to the '
+                        'clip (duplicates are only found in the same place '
+                        'of the clip)')
+    parser.add_argument('--pixel-size', type=int,
+                        help='sprite pixel size (detected when not given)')
+    parser.add_argument('--tolerance', type=int,
+                        help='perceptual hash tolerance for duplicate sprites')
+    args = parser.parse_args(argv)
+    tasks = []
+    for inputDir in args.inputs:
+        inputName = os.path.splitext(os.path.basename(os.path.normpath(inputDir)))[0]
+        tasks.append((inputDir, os.path.join(args.out, inputName), vars(args)))
+    if args.dry_run:
+        for (inputDir, outputDir, options) in tasks:
+            print('%s -> %s' % (inputDir, outputDir))
+        return 0
+    results = _runAll(_extractInput, tasks, args.jobs)
+    return 0 if all(results) else 1
+
+def _runAll(function, tasks, jobs):
+    """Runs a function for each task in a pool of jobs processes."""
+    if jobs <= 1 or len(tasks) <= 1:
+        return [function(x) for x in tasks]
+    pool = Pool(min(jobs, len(tasks)))
+    try:
+        return pool.map(function, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+def _checkJob(jobFile):
+    """Prints the size of a job and returns an error message if the job
+       cannot be rendered.
+    """
+    try:
+        with open(jobFile) as jobData:
+            job = json.load(jobData)
+        jobDir = os.path.dirname(os.path.abspath(jobFile))
+        missing = [x for events in job['elements'].values()
+                   for x in events.values()
+                   if not os.path.isdir(os.path.join(jobDir, x))]
+        frameCount = sum([x.get('repeat', 1) for x in job['frames']])
+        spriteCount = sum([len(x['sprites']) for x in job['frames']])
+    except (IOError, OSError, ValueError, KeyError, TypeError) as error:
+        print('%s: invalid job (%s)' % (jobFile, error))
+        return str(error)
+    print('%s: %d elements, %d saved frames, %d frames, %d sprites -> %s'
+          % (jobFile, len(job['elements']), len(job['frames']), frameCount,
+             spriteCount, os.path.join(jobDir, job['outDir'])))
+    for imageFolderDir in missing:
+        print('%s: missing sprite folder %s' % (jobFile, imageFolderDir))
+    return ', '.join(missing)
+
+def _renderJob(task):
+    """Renders a job file with the render argument overrides."""
+    (jobFile, overrides) = task
+    from sprite_tools.service import loadJob
+    try:
+        (frame, renderArgs) = loadJob(jobFile)
+        renderArgs.update(overrides)
+        if not os.path.exists(renderArgs['outDir']):
+            os.makedirs(renderArgs['outDir'])
+        frame.render(**renderArgs)
+    except Exception as error:
+        print('%s: failed (%s)' % (jobFile, error))
+        return False
+    print('%s: rendered %d frames' % (jobFile, len(frame.frameList)))
+    return True
+
+def _extractInput(task):
+    """Runs the extractor pipeline over a folder of frames or a video."""
+    (inputDir, outputDir, options) = task
+    import cv2
+    from sprite_tools.extractor import Extractor
+    try:
+        extractor = Extractor()
+        if os.path.isdir(inputDir):
+            sprites = extractor.getSprite(inputDir, options['input_prefix'])
+        else:
+            sprites = []
+            video = cv2.VideoCapture(inputDir)
+            (success, image) = video.read()
+            while success:
+                sprites.append(image)
+                (success, image) = video.read()
+            video.release()
+        if len(sprites) == 0:
+            print('%s: no frames found' % inputDir)
+            return False
+        background = None
+        if options['background'] is not None:
+            background = cv2.imread(options['background'])
+        (sprites, offsets) = extractor.isolateSprite(sprites, background,
+                                                     options['limit'],
+                                                     options['area_toggle'],
+                                                     options['crop'])
+        (sprites, offsets) = extractor.cleanSprite(sprites, None,
+                                                   options['pixel_size'],
+                                                   offsets)
+        (sprites, frameMap) = extractor.dedupSprite(sprites, options['tolerance'])
+        extractor.saveSprite(sprites, outputDir, options['prefix'], frameMap,
+                             offsets)
+    except Exception as error:
+        print('%s: failed (%s)' % (inputDir, error))
+        return False
+    print('%s: %d frames, %d unique sprites -> %s'
+          % (inputDir, len(frameMap), len(sprites), outputDir))
+    return True
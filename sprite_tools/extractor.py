@@ -3,8 +3,8 @@
 import numpy as np
 import cv2
 import os
+import hashlib
 import re
-from scipy import ndimage
 
 class Extractor(object):
 	def getSprite(self,inputFolderName,inputFilePrefix):
@@ -56,16 +56,84 @@ class Extractor(object):
 		newY = spriteY - cropY
 		return (newX,newY)	
 
-	def cleanSprite(self,sprites,pixelRef,spritePixelSize):
+	def detectPixelGrid(self,sprites,maxPixelSize=16,spritePixelSize=None):
+		"""Returns a tuple of the pixelRef, spritePixelSize and confidence of the sprite pixel grid found in an image sequence
+		
+		Keyword Arguments:
+		sprites -- list of cv2 numpy image arrays corresponding to image sequence (a single cv2 numpy image array is also accepted)
+		maxPixelSize -- largest sprite pixel size (in pixels) that is tested
+		spritePixelSize -- known sprite pixel size (in pixels). Only the pixelRef is detected when this is given
+
+		The edge strength between neighbouring columns and rows is summed over the image sequence and the grid that holds the most edge strength on the fewest grid lines is chosen. The confidence is the fraction of the edge strength that lies on the chosen grid lines (between 0 and 1).
+
+		Images of different sizes (i.e. from isolateSprite with cropMode 'frame') do not share a grid offset. The spritePixelSize is then detected from the edge strength of each image with its own offset and the returned pixelRef is None. Use detectPixelGrid on each image with the spritePixelSize to find its pixelRef.
+		"""
+		if isinstance(sprites, np.ndarray):
+			sprites = [sprites]
+		edgeProfiles = [] # (column edges, row edges) of each image
+		for curSprite in sprites:
+			curSprite = curSprite.astype(np.int16)
+			edgeProfiles.append((np.abs(np.diff(curSprite, axis=1)).sum(axis=(0,2)), np.abs(np.diff(curSprite, axis=0)).sum(axis=(1,2))))
+		sameShape = len(set([(len(x[0]),len(x[1])) for x in edgeProfiles])) <= 1
+		if sameShape and len(edgeProfiles) > 1:
+			edgeProfiles = [(sum([x[0] for x in edgeProfiles]), sum([x[1] for x in edgeProfiles]))]
+		if spritePixelSize is None:
+			pixelSizes = range(2, maxPixelSize + 1)
+		else:
+			pixelSizes = [spritePixelSize]
+		bestGrid = ((0,0) if sameShape else None, 1, 0.0)
+		bestScore = -1.0
+		for pixelSize in pixelSizes:
+			score = 0.0
+			fractions = []
+			for (columnEdges,rowEdges) in edgeProfiles:
+				if min(len(columnEdges),len(rowEdges)) < pixelSize:
+					continue
+				(refX,scoreX,fractionX) = self._gridPhase(columnEdges,pixelSize)
+				(refY,scoreY,fractionY) = self._gridPhase(rowEdges,pixelSize)
+				score += scoreX + scoreY
+				fractions.append(float(fractionX + fractionY) / 2)
+			if len(fractions) > 0 and score > bestScore:
+				bestScore = score
+				bestGrid = ((refX,refY) if sameShape else None, pixelSize, sum(fractions) / len(fractions))
+		return bestGrid
+
+	def _gridPhase(self,edges,pixelSize):
+		"""Returns the grid offset, score and edge strength fraction of the best grid with the given spacing along one axis"""
+		total = float(edges.sum())
+		if total == 0:
+			return (0, 0.0, 0.0)
+		pixelStart = (np.arange(len(edges)) + 1) % pixelSize # edges[i] lies between video pixel i and i+1
+		phaseEdges = np.bincount(pixelStart, weights=edges, minlength=pixelSize)
+		phaseCount = np.bincount(pixelStart, minlength=pixelSize)
+		phaseMean = phaseEdges / np.maximum(phaseCount, 1)
+		phase = int(np.argmax(phaseMean))
+		fraction = phaseEdges[phase] / total
+		concentration = phaseMean[phase] / (total / len(edges))
+		return (phase, fraction * concentration, fraction)
+
+	def cleanSprite(self,sprites,pixelRef=None,spritePixelSize=None,offsets=None):
 		"""Returns a list of cv2 numpy image arrays that corresponds to the colors and dimensions of the original uncompressed sprite
 		
 		Keyword Arguments:
 		sprites -- list of cv2 numpy image arrays corresponding to image sequence
-		pixelRef -- tuple of coordinates of top left corner of sprite pixel relative to the top left corner of the cropped image
-		spritePixelSize -- length of sides (in pixels) of the sprite pixel in relation to the video pixels (i.e. input 3 if one sprite pixel corresonds to a 3 by 3 square of video pixels) 
+		pixelRef -- tuple of coordinates of top left corner of sprite pixel relative to the top left corner of the cropped image (None detects the pixelRef with detectPixelGrid)
+		spritePixelSize -- length of sides (in pixels) of the sprite pixel in relation to the video pixels (i.e. input 3 if one sprite pixel corresonds to a 3 by 3 square of video pixels) (None detects the spritePixelSize with detectPixelGrid)
+		offsets -- list of (x,y) offsets in video pixels returned by isolateSprite with a cropMode. When given, a tuple of the cleaned images and the offsets of the cleaned images in sprite pixels is returned
 		"""
 		spritesCleaned = []
+		offsetsCleaned = []
+		if pixelRef is None or spritePixelSize is None:
+			(gridRef,gridSize,confidence) = self.detectPixelGrid(sprites, spritePixelSize=spritePixelSize)
+			if confidence < 0.5:
+				print('Warning in cleanSprite Method: Low confidence (%.2f) in detected sprite pixel grid' % confidence)
+			if pixelRef is None:
+				pixelRef = gridRef # None for images of different sizes
+			spritePixelSize = gridSize
+		spriteRef = pixelRef
 		for curSprite in sprites:		
+			if spriteRef is None:
+				pixelRef = self.detectPixelGrid(curSprite, spritePixelSize=spritePixelSize)[0]
 			# Use the coordinate of the top left corner of the sprite pixel and check if the distance between the edges of the image and the pixel are divisible by the desired pixel size. Delete the rows and columns equal to the remainder associated with each edge.
 			[rowCount,columnCount,BGR] = curSprite.shape
 			cut = []
@@ -76,7 +144,7 @@ class Extractor(object):
 			cut = [x % spritePixelSize for x in cut] # gives number of rows or columns that need to be removed from each edge
 			newHeight = rowCount - (cut[1] + cut[3])
 			newWidth = columnCount - (cut[0] + cut[2])
-			spriteCropped = curSprite[cut[1]:newHeight-cut[1],cut[2]:newWidth-cut[0],:] # sprite[height,width,bgr]
+			spriteCropped = curSprite[cut[1]:cut[1]+newHeight,cut[2]:cut[2]+newWidth,:] # sprite[height,width,bgr]
 
 			# Create the cleaned sprite by averaging the BGR values of each pixel contained within 
 			newHeight = newHeight / spritePixelSize
@@ -90,18 +158,87 @@ class Extractor(object):
 					newPixelMean = pixelMean2.astype(int)
 					curSpriteCleaned[y,x] = newPixelMean
 			spritesCleaned.append(curSpriteCleaned)
+			if offsets is not None:
+				# The first cleaned pixel starts after the rows and columns cut from the top and left edges
+				curOffset = offsets[len(offsetsCleaned)]
+				offsetsCleaned.append(((curOffset[0] + cut[2]) // spritePixelSize, (curOffset[1] + cut[1]) // spritePixelSize))
+		if offsets is not None:
+			return (spritesCleaned, offsetsCleaned)
 		return spritesCleaned
 
-	def isolateSprite(self,sprites, background, limit, areaToggle = False):
+	def estimateBackground(self,sprites,chunkSize=16):
+		"""Returns a cv2 numpy image array of the static background of an image sequence using the per-pixel temporal median
+		
+		Keyword Arguments:
+		sprites -- list or iterable of cv2 numpy image arrays corresponding to image sequence
+		chunkSize -- number of images held in memory at once per level. The exact median is returned for image sequences of up to chunkSize images. Longer sequences are reduced a chunk at a time to chunkSize / 2 quantile images (the lower and upper image of each sorted pair in turn) which are reduced the same way, so memory stays bounded for long image sequences
+		"""
+		chunkLevels = [[]] # chunkLevels[i] holds the images of level i
+		levelWeights = [1] # number of captured images each image of a level stands for
+		reductionCount = 0
+		for curSprite in sprites:
+			chunkLevels[0].append(curSprite)
+			level = 0
+			while len(chunkLevels[level]) == chunkSize:
+				quantileCount = max(1, chunkSize // 2)
+				# Alternating between the lower and upper quantile images keeps the reductions from shifting the median one way
+				chunkQuantiles = self._quantileSprite(chunkLevels[level], quantileCount, reductionCount % 2 == 1)
+				reductionCount += 1
+				chunkLevels[level] = []
+				level += 1
+				if level == len(chunkLevels):
+					chunkLevels.append([])
+					levelWeights.append(levelWeights[-1] * chunkSize // quantileCount)
+				chunkLevels[level].extend(chunkQuantiles)
+		if sum([len(x) for x in chunkLevels]) == 0:
+			print('Error in estimateBackground Method: No sprites found')
+			return
+		if len(chunkLevels) == 1:
+			spriteMedian = np.median(np.stack(chunkLevels[0]), axis=0)
+			return np.round(spriteMedian).astype(np.uint8)
+		return self._weightedMedianSprite(chunkLevels, levelWeights)
+
+	def _quantileSprite(self,sprites,quantileCount,upper=False):
+		"""Returns quantileCount evenly spaced per-pixel quantiles of a list of equally weighted cv2 numpy image arrays. Each quantile is the lowest (or upper is True, highest) sorted image of its group"""
+		spriteSorted = np.stack(sprites)
+		spriteSorted.sort(axis=0) # in place on the uint8 stack
+		groupSize = len(sprites) // quantileCount
+		shift = groupSize - 1 if upper else 0
+		return [spriteSorted[i * groupSize + shift].copy() for i in range(quantileCount)]
+
+	def _weightedMedianSprite(self,chunkLevels,levelWeights):
+		"""Returns the per-pixel weighted median of the images of all levels where each image of level i has weight levelWeights[i]"""
+		weightedSprites = [(x, levelWeights[i]) for i in range(len(chunkLevels)) for x in chunkLevels[i]]
+		halfWeight = sum([x[1] for x in weightedSprites]) / 2.0
+		spriteMedian = np.zeros(weightedSprites[0][0].shape, dtype=np.uint8)
+		# Sets the bits of the median from the highest bit down, keeping a bit if less than half of the weight is below it
+		for bit in (128, 64, 32, 16, 8, 4, 2, 1):
+			trialMedian = spriteMedian | bit
+			weightBelow = np.zeros(spriteMedian.shape, dtype=np.float32)
+			for (curSprite, weight) in weightedSprites:
+				weightBelow += (curSprite < trialMedian) * np.float32(weight)
+			spriteMedian = np.where(weightBelow < halfWeight, trialMedian, spriteMedian)
+		return spriteMedian
+
+	def isolateSprite(self,sprites, background, limit, areaToggle = False, cropMode = None):
 		"""Attempts to return a cv2 numpy image array corresponding to the image sequence with the background removed
 		
 		Keyword Arguments:
 		sprites -- list of cv2 numpy image arrays corresponding to image sequence
-		background -- background image to be removed from the image seqeunce
+		background -- background image to be removed from the image seqeunce (None estimates the background from the image sequence with estimateBackground)
 		limit -- a nonnegative integer cleaning multiplier for finding background pixels
 		areaToggle -- Used to toggle which collection of pixels to remove from the image sequence. 
+		cropMode -- None keeps the full frame. 'frame' crops each image to the bounding box of its sprite area and 'clip' crops all images to the union of these bounding boxes. When set, a tuple of the cropped images and a list of (x,y) offsets of their top left corners in the full frame is returned
+
+		The offsets are in video pixels. Pass them to cleanSprite to convert them to the sprite pixels of the cleaned images so they can be used as Frame.add positions that line up with the captured frames.
 		"""
+		if cropMode not in (None, 'frame', 'clip'):
+			raise ValueError("cropMode must be None, 'frame' or 'clip' (got %r)" % (cropMode,))
+		from scipy import ndimage # imported here so the module loads without SciPy
 		spritesIsolated = []
+		spriteBoxes = []
+		if background is None:
+			background = self.estimateBackground(sprites)
 		upperLimit = np.add(background,limit)
 		lowerLimit = np.subtract(background,limit)
 		for curSprite in sprites:
@@ -144,17 +281,82 @@ class Extractor(object):
 			spriteComposite[:,:,1] = spriteMasked[:,:]
 			spriteComposite[:,:,2] = spriteMasked[:,:]
 			spriteIsolated = np.multiply(curSprite,spriteComposite)
+			if cropMode is not None:
+				# Reuse the labeled regions to find the bounding box of the sprite area
+				spriteLabel = uniqueLabel[spriteAreaIndex]
+				if spriteLabel > 0:
+					(boxY,boxX) = ndimage.find_objects(labelArray, max_label=spriteLabel)[spriteLabel-1]
+					spriteBox = (boxY.start,boxY.stop,boxX.start,boxX.stop)
+				else:
+					maskRows = np.flatnonzero(np.any(spriteMasked, axis=1))
+					maskColumns = np.flatnonzero(np.any(spriteMasked, axis=0))
+					spriteBox = (maskRows[0],maskRows[-1]+1,maskColumns[0],maskColumns[-1]+1)
+				spriteBoxes.append(spriteBox)
+				if cropMode == 'frame':
+					spriteIsolated = spriteIsolated[spriteBox[0]:spriteBox[1],spriteBox[2]:spriteBox[3],:]
 			spritesIsolated.append(spriteIsolated)
 			
-		return spritesIsolated
+		if cropMode is None:
+			return spritesIsolated
+		if cropMode == 'clip' and len(spriteBoxes) > 0:
+			clipBox = (min([x[0] for x in spriteBoxes]),max([x[1] for x in spriteBoxes]),min([x[2] for x in spriteBoxes]),max([x[3] for x in spriteBoxes]))
+			spritesIsolated = [x[clipBox[0]:clipBox[1],clipBox[2]:clipBox[3],:] for x in spritesIsolated]
+			spriteBoxes = [clipBox for x in spriteBoxes]
+		offsets = [(int(x[2]),int(x[0])) for x in spriteBoxes]
+		return (spritesIsolated, offsets)
+
+	def dedupSprite(self,sprites,tolerance=None):
+		"""Returns a tuple of the list of unique cv2 numpy image arrays in an image sequence and a list that maps each image of the sequence to the index of its unique image
+		
+		Keyword Arguments:
+		sprites -- list of cv2 numpy image arrays corresponding to image sequence
+		tolerance -- maximum number of differing bits between the 64 bit perceptual hashes of two images of the same size for them to be treated as the same sprite (None only removes exact duplicates)
+		"""
+		uniqueSprites = []
+		frameMap = []
+		exactIndex = {} # exact hash -> index of unique sprite
+		perceptualIndex = {} # image shape -> (perceptual hashes, indices of unique sprites)
+		for curSprite in sprites:
+			exactHash = (curSprite.shape, hashlib.sha1(curSprite.tobytes()).hexdigest())
+			if exactHash in exactIndex:
+				frameMap.append(exactIndex[exactHash])
+				continue
+			spriteIndex = None
+			if tolerance is not None:
+				curHash = self._perceptualHash(curSprite)
+				(shapeHashes,shapeIndices) = perceptualIndex.setdefault(curSprite.shape, ([],[]))
+				if len(shapeHashes) > 0:
+					hashDiff = np.bitwise_xor(np.array(shapeHashes, dtype=np.uint64), curHash)
+					hashDist = np.unpackbits(hashDiff.view(np.uint8).reshape(-1,8), axis=1).sum(axis=1)
+					closest = np.argmin(hashDist)
+					if hashDist[closest] <= tolerance:
+						spriteIndex = shapeIndices[closest]
+				if spriteIndex is None:
+					shapeHashes.append(curHash)
+					shapeIndices.append(len(uniqueSprites))
+			if spriteIndex is None:
+				spriteIndex = len(uniqueSprites)
+				uniqueSprites.append(curSprite)
+			exactIndex[exactHash] = spriteIndex
+			frameMap.append(spriteIndex)
+		return (uniqueSprites, frameMap)
+
+	def _perceptualHash(self,sprite):
+		"""Returns the 64 bit difference hash of a cv2 numpy image array"""
+		spriteGray = cv2.cvtColor(sprite, cv2.COLOR_BGR2GRAY)
+		spriteSmall = cv2.resize(spriteGray, (9,8), interpolation=cv2.INTER_AREA)
+		hashBits = spriteSmall[:,1:] > spriteSmall[:,:-1]
+		return np.packbits(hashBits.flatten()).view(np.uint64)[0]
 
-	def saveSprite(self,sprites,outputFolderName,outputFilePrefix):
+	def saveSprite(self,sprites,outputFolderName,outputFilePrefix,frameMap=None,offsets=None):
 		""" Outputs the image sequence to file 
 		
 		Keyword Arguments:
 		sprites -- list of cv2 numpy image arrays corresponding to image sequence
 		outputFolderName -- relative directory where sprite image sequence will be saved to
 		outputFilePrefix --beginning of name of sprite image file (assumes file name is of pattern FILENAME_000.png)
+		frameMap -- list returned by dedupSprite that maps each captured frame to a saved sprite. The map is saved as FILENAME_map.csv with a frame,sprite row per captured frame
+		offsets -- list of (x,y) offsets returned by isolateSprite with a cropMode or by cleanSprite. The offsets are saved as FILENAME_offsets.csv with a frame,x,y row per captured frame
 		"""
 		if len(sprites) > 0:
 			if not os.path.exists(outputFolderName):
@@ -162,5 +364,17 @@ class Extractor(object):
 			for i in range(len(sprites)):
 				newFileName = outputFolderName + '/' + outputFilePrefix + ('%.*d' % ((len(str(len(sprites)))),i)) + '.png'
 				cv2.imwrite(newFileName, sprites[i])
+			if frameMap is not None:
+				mapFile = open(outputFolderName + '/' + outputFilePrefix + 'map.csv', 'w')
+				mapFile.write('frame,sprite\n')
+				for i in range(len(frameMap)):
+					mapFile.write('%d,%d\n' % (i, frameMap[i]))
+				mapFile.close()
+			if offsets is not None:
+				offsetFile = open(outputFolderName + '/' + outputFilePrefix + 'offsets.csv', 'w')
+				offsetFile.write('frame,x,y\n')
+				for i in range(len(offsets)):
+					offsetFile.write('%d,%d,%d\n' % (i, offsets[i][0], offsets[i][1]))
+				offsetFile.close()
 		else:
 			print('Error in saveSprite Method: No sprites found')
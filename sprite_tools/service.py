@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+""" Renders animation jobs in a long lived process with warm sprite caches.
+
+    Description:
+
+    Each animation script normally starts a new Python process that imports
+    OpenCV and numpy, reads every sprite folder of its FrameElements and
+    renders a single Frame. This module keeps one process running that
+    renders animation jobs as they arrive so the imports, decoded sprite
+    folders and transformed sprites are reused between jobs.
+
+    Jobs are JSON files dropped into a job directory. The RenderService
+    watches this directory, claims new jobs and renders them on a pool of
+    worker threads (OpenCV and numpy release the GIL while processing
+    images). Decoded sprite folders and transformed sprites are kept in a
+    shared SpriteCache under a memory budget. The latency and sprite cache
+    hits of each job and the throughput of the service (over the time it
+    was rendering jobs) are printed and stored with the result of the job.
+
+    Job Format:
+
+    {"outDir": "./Cat_Animation_Frames",
+     "outPrefix": "Frame_",
+     "alphaChannel": 0,
+     "elements": {"cat": {"sitting": "./Sprites/Cat/Sitting"}},
+     "frames": [{"repeat": 30,
+                 "sprites": [{"element": "cat", "event": "sitting",
+                              "image": 0, "position": [52, 476],
+                              "alpha": 1, "rotation": 0, "scale": 10,
+                              "flip": [false, false]}]}],
+     "render": {"previewScale": 0.25, "frameStride": 4}}
+
+    - Each entry of 'frames' is the set of Frame.add instructions followed
+      by Frame.save(repeat). 'flip' and 'repeat' are optional.
+    - 'render' holds optional keyword arguments of Frame.render.
+    - Relative directories are relative to the directory of the job file.
+
+    A job named JOB.json is renamed to JOB.json.running while it renders
+    and to JOB.json.done (or JOB.json.failed) once finished. The result of
+    the job is written to JOB.json.result.
+
+    Example:
+    - python -m sprite_tools.service ./Jobs --workers 4 --memory 1024
+    - submitJob('./Jobs', 'cat_animation', job) from another script.
+"""
+
+import os
+import json
+import time
+import threading
+import traceback
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from sprite_tools.animator import Frame, FrameElement
+
+class SpriteCache(object):
+
+    """Keeps sprite images in memory under a memory budget.
+
+       Summary of Class Methods:
+       get -- Returns a cached value or None.
+       put -- Stores a value and evicts the least recently used values.
+
+       The cache is shared by decoded sprite folders and transformed sprites
+       of Frame. It is safe to use from multiple threads.
+
+       Keyword Arguments:
+       maxBytes -- Memory budget (in bytes) of all cached values.
+    """
+
+    def __init__(self, maxBytes=512 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.curBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value stored with key or None if it is not cached."""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            entry = self.entries.pop(key)
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Stores a value that occupies nbytes of memory with key."""
+        with self.lock:
+            if key in self.entries:
+                self.curBytes -= self.entries.pop(key)[1]
+            if nbytes > self.maxBytes:
+                return
+            self.entries[key] = (value, nbytes)
+            self.curBytes += nbytes
+            while self.curBytes > self.maxBytes:
+                (oldKey, oldEntry) = self.entries.popitem(last=False)
+                self.curBytes -= oldEntry[1]
+
+class _JobCache(object):
+
+    """Counts the hits and misses of one job on a shared SpriteCache."""
+
+    def __init__(self, spriteCache):
+        self.spriteCache = spriteCache
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the value stored with key or None if it is not cached."""
+        value = self.spriteCache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, nbytes):
+        """Stores a value that occupies nbytes of memory with key."""
+        self.spriteCache.put(key, value, nbytes)
+
+def loadJob(jobFile, spriteCache=None):
+    """Returns a Frame with the saved frames of a job file and the keyword
+       arguments of its render.
+
+       Keyword Arguments:
+       jobFile     -- Directory of the JSON job file.
+       spriteCache -- SpriteCache that keeps decoded sprite folders and
+                      transformed sprites between jobs.
+    """
+    with open(jobFile) as jobData:
+        job = json.load(jobData)
+    jobDir = os.path.dirname(os.path.abspath(jobFile))
+    elements = {}
+    for (elemName, events) in job['elements'].items():
+        elements[elemName] = FrameElement()
+        for (eventName, imageFolderDir) in events.items():
+            imageFolderDir = os.path.join(jobDir, imageFolderDir)
+            _loadEvent(elements[elemName], eventName, imageFolderDir,
+                       spriteCache)
+    frame = Frame(spriteCache)
+    frame.setAlpha(job.get('alphaChannel', 0))
+    for curFrame in job['frames']:
+        for sprite in curFrame['sprites']:
+            frame.add(elements[sprite['element']], sprite['event'],
+                      sprite['image'], tuple(sprite['position']),
+                      sprite['alpha'], sprite['rotation'], sprite['scale'],
+                      tuple(sprite.get('flip', (False, False))))
+        frame.save(curFrame.get('repeat', 1))
+    renderArgs = dict(job.get('render', {}))
+    renderArgs['outDir'] = os.path.join(jobDir, job['outDir'])
+    renderArgs['outPrefix'] = job['outPrefix']
+    return (frame, renderArgs)
+
+def _loadEvent(frameElem, eventName, imageFolderDir, spriteCache=None):
+    """Adds an event to a FrameElement using the cached sprite images."""
+    if spriteCache is None:
+        frameElem.addNewEvent(eventName, imageFolderDir)
+        return
+    # Overwriting a sprite does not change the modification time of the
+    # folder, so the key holds the modification time and size of each file
+    fileStats = []
+    for fileName in sorted(os.listdir(imageFolderDir)):
+        fileStat = os.stat(os.path.join(imageFolderDir, fileName))
+        fileStats.append((fileName, fileStat.st_mtime, fileStat.st_size))
+    key = ('event', os.path.abspath(imageFolderDir), tuple(fileStats))
+    event = spriteCache.get(key)
+    if event is None:
+        frameElem.addNewEvent(eventName, imageFolderDir)
+        # The trimmed sprites are views of the sprite images that are shared
+        event = (frameElem.eventDict[eventName], frameElem.trimDict[eventName])
+        spriteCache.put(key, event, sum([x.nbytes for x in event[0]]))
+    (frameElem.eventDict[eventName], frameElem.trimDict[eventName]) = event
+
+def submitJob(jobDir, jobName, job):
+    """Writes a job to the job directory of a RenderService.
+
+       Keyword Arguments:
+       jobDir  -- Directory watched by the RenderService.
+       jobName -- Name of the job file without the .json extension.
+       job     -- Dictionary in the job format of this module.
+    """
+    tmpFile = os.path.join(jobDir, jobName + '.json.tmp')
+    with open(tmpFile, 'w') as jobData:
+        json.dump(job, jobData)
+    # Rename so the service never reads a partially written job
+    os.rename(tmpFile, os.path.join(jobDir, jobName + '.json'))
+
+class RenderService(object):
+
+    """Watches a job directory and renders the jobs that are dropped in it.
+
+       Summary of Class Methods:
+       serve  -- Watches the job directory until stopped.
+       poll   -- Claims and schedules the new jobs in the job directory.
+       stop   -- Stops serve after the running jobs are finished.
+
+       Keyword Arguments:
+       jobDir       -- Directory that is watched for JSON job files.
+       workers      -- Number of jobs that are rendered at the same time.
+       maxBytes     -- Memory budget (in bytes) of the shared SpriteCache.
+       pollInterval -- Seconds between checks of the job directory.
+    """
+
+    def __init__(self, jobDir, workers=2, maxBytes=512 * 1024 * 1024,
+                 pollInterval=1.0):
+        self.jobDir = jobDir
+        self.pollInterval = pollInterval
+        self.spriteCache = SpriteCache(maxBytes)
+        self.pool = ThreadPool(workers)
+        self.lock = threading.Lock()
+        self.running = False
+        self.activeJobs = 0
+        self.busySince = None
+        self.busyTime = 0.0
+        self.jobCount = 0
+        self.frameCount = 0
+
+    def serve(self):
+        """Renders new jobs in the job directory until stop is called."""
+        self.running = True
+        print('Render service watching %s' % self.jobDir)
+        try:
+            while self.running:
+                self.poll()
+                time.sleep(self.pollInterval)
+        finally:
+            self.pool.close()
+            self.pool.join()
+
+    def stop(self):
+        """Stops serve after the running jobs are finished."""
+        self.running = False
+
+    def poll(self):
+        """Claims the new jobs in the job directory and schedules them on
+           the worker pool in the order they were submitted.
+        """
+        jobFiles = []
+        for fileName in os.listdir(self.jobDir):
+            if not fileName.endswith('.json'):
+                continue
+            jobFile = os.path.join(self.jobDir, fileName)
+            try:
+                jobFiles.append((os.path.getmtime(jobFile), jobFile))
+            except OSError:
+                continue # claimed by another service since listdir
+        jobFiles.sort()
+        for (mtime, jobFile) in jobFiles:
+            try:
+                os.rename(jobFile, jobFile + '.running')
+            except OSError:
+                continue # claimed by another service
+            self.pool.apply_async(self._runJob, (jobFile,))
+
+    def _runJob(self, jobFile):
+        """Renders a claimed job and stores its result."""
+        startTime = time.time()
+        with self.lock:
+            # Throughput is measured over the time at least one job renders
+            if self.activeJobs == 0:
+                self.busySince = startTime
+            self.activeJobs += 1
+        result = {'job': os.path.basename(jobFile)}
+        jobCache = _JobCache(self.spriteCache)
+        try:
+            (frame, renderArgs) = loadJob(jobFile + '.running', jobCache)
+            if not os.path.exists(renderArgs['outDir']):
+                os.makedirs(renderArgs['outDir'])
+            frame.render(**renderArgs)
+            status = 'done'
+            result['frames'] = len(frame.frameList)
+        except Exception:
+            status = 'failed'
+            result['frames'] = 0
+            result['error'] = traceback.format_exc()
+        endTime = time.time()
+        result['latency'] = endTime - startTime
+        result['cacheHits'] = jobCache.hits
+        result['cacheMisses'] = jobCache.misses
+        with self.lock:
+            self.activeJobs -= 1
+            if self.activeJobs == 0:
+                self.busyTime += endTime - self.busySince
+                self.busySince = endTime
+            busyTime = self.busyTime + (endTime - self.busySince)
+            self.jobCount += 1
+            self.frameCount += result['frames']
+            result['busyTime'] = busyTime
+            result['jobsPerMinute'] = self.jobCount * 60.0 / busyTime
+            result['framesPerSecond'] = self.frameCount / busyTime
+            result['totalCacheHits'] = self.spriteCache.hits
+            result['totalCacheMisses'] = self.spriteCache.misses
+        with open(jobFile + '.result', 'w') as resultData:
+            json.dump(result, resultData, indent=1)
+        os.rename(jobFile + '.running', jobFile + '.' + status)
+        report = ('%s %s: %d frames in %.2f s, %d cache hits, %d misses '
+                  '(service: %.1f jobs/min, %.1f frames/s)' 
+                  % (result['job'], status, result['frames'], 
+                     result['latency'], result['cacheHits'], 
+                     result['cacheMisses'], result['jobsPerMinute'],
+                     result['framesPerSecond']))
+        if status == 'failed':
+            report += '\n' + result['error']
+        print(report)
+
+def main(argv=None):
+    """Starts a RenderService from the command line."""
+    import argparse
+    parser = argparse.ArgumentParser(description='Renders animation jobs '
+                                     'dropped into a job directory.')
+    parser.add_argument('jobDir', help='directory watched for JSON jobs')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='number of jobs rendered at the same time')
+    parser.add_argument('--memory', type=int, default=512,
+                        help='memory budget of the sprite cache in MB')
+    parser.add_argument('--poll', type=float, default=1.0,
+                        help='seconds between checks of the job directory')
+    args = parser.parse_args(argv)
+    service = RenderService(args.jobDir, args.workers,
+                            args.memory * 1024 * 1024, args.poll)
+    try:
+        service.serve()
+    except KeyboardInterrupt:
+        service.stop()
+
+if __name__ == '__main__':
+    main()